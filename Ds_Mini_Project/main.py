@@ -15,9 +15,16 @@ import os
 import json
 import sqlite3
 import hashlib
+import hmac
 import uuid
 import csv
-from typing import Dict, List, Optional
+import functools
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
 from datetime import datetime
 
 # Optional PDF export
@@ -28,6 +35,16 @@ try:
 except Exception:
     REPORTLAB_AVAILABLE = False
 
+# Optional faster JSON for the `extra` column
+try:
+    import orjson
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+    _loads = orjson.loads
+except Exception:
+    _dumps = json.dumps
+    _loads = json.loads
+
 # Constants
 DATA_DIR = "db_data"
 JSON_STUDENTS = os.path.join(DATA_DIR, "students.json")
@@ -38,19 +55,176 @@ SQLITE_FILE = os.path.join(DATA_DIR, "students.db")
 COLLEGE_DOMAIN = "college.edu"
 MAX_PER_DIVISION = 70
 DIVISIONS = ["1", "2", "3"]
+SQLITE_CACHED_STATEMENTS = 256  # per-connection prepared-statement cache
+READ_POOL_SIZE = 4  # reader connections; writes share one connection behind a lock
+COUNTS_TTL_SECONDS = 1.0  # how long branch/division counts may be served from memory
+EXPORT_COLUMNS = "prn, class_roll, first_name, last_name, branch, division, email"
+# password KDFs; rows without a recorded kdf predate scrypt and use KDF_SHA256
+KDF_SCRYPT = "scrypt"
+KDF_SHA256 = "sha256"
+SCRYPT_N, SCRYPT_R, SCRYPT_P, SCRYPT_DKLEN = 16384, 8, 1, 32
+
+# SQL (hot statements live here so every call site reuses the same text
+# and hits the connection's prepared-statement cache)
+_STUDENT_INSERT_COLUMNS = "prn, class_roll, username, salt, pw_hash, kdf, first_name, last_name, branch, division, email, extra"
+SQL_INSERT_STUDENT = f"INSERT INTO students ({_STUDENT_INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_INSERT_OR_IGNORE_STUDENT = f"INSERT OR IGNORE INTO students ({_STUDENT_INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+# partial updates: NULL parameters keep the current value, so one statement covers every combination
+STUDENT_UPDATE_COLUMNS = ("first_name", "last_name", "email", "branch", "division", "class_roll", "extra", "salt", "pw_hash", "kdf")
+SQL_UPDATE_STUDENT = (
+    "UPDATE students SET "
+    + ", ".join(f"{c} = COALESCE(?, {c})" for c in STUDENT_UPDATE_COLUMNS)
+    + " WHERE prn = ?"
+)
+SQL_INSERT_STUDENT_RETURNING = SQL_INSERT_STUDENT + " RETURNING *"
+SQL_UPDATE_STUDENT_RETURNING = SQL_UPDATE_STUDENT + " RETURNING *"
+SQL_DELETE_STUDENT = "DELETE FROM students WHERE prn = ?"
+SQL_FIND_STUDENT_BY_PRN = "SELECT * FROM students WHERE prn = ?"
+SQL_FIND_STUDENT_BY_USERNAME = "SELECT * FROM students WHERE username = ?"
+SQL_FIND_STUDENT_BY_CLASS_ROLL = "SELECT * FROM students WHERE class_roll = ?"
+SQL_STUDENT_USERNAME_EXISTS = "SELECT 1 FROM students WHERE username = ?"
+SQL_COUNT_STUDENTS = "SELECT COUNT(*) as c FROM students"
+SQL_SEARCH_STUDENTS_FTS = "SELECT * FROM students WHERE rowid IN (SELECT rowid FROM students_fts WHERE students_fts MATCH ?)"
+SQL_SEARCH_STUDENTS_LIKE = "SELECT * FROM students WHERE first_name LIKE ? OR last_name LIKE ?"
+SQL_COUNT_BY_BRANCH_DIVISION = "SELECT division, count as c FROM branch_division_counts WHERE branch = ?"
+# lowest division of a branch with a free seat, with its current head count; params (branch, MAX_PER_DIVISION)
+SQL_FIRST_OPEN_DIVISION = (
+    "WITH d (division) AS (VALUES " + ", ".join(f"('{d}')" for d in DIVISIONS) + ") "
+    "SELECT d.division, COALESCE(c.count, 0) as c FROM d "
+    "LEFT JOIN branch_division_counts c ON c.branch = ? AND c.division = d.division "
+    "WHERE COALESCE(c.count, 0) < ? ORDER BY d.division LIMIT 1"
+)
+SQL_LIST_ALL_STUDENTS = ("SELECT prn, class_roll, first_name, last_name, branch, division, email, username "
+                         "FROM students ORDER BY branch, division, class_roll")
+SQL_INSERT_TEACHER = "INSERT INTO teachers (username, salt, pw_hash, kdf, name, branch) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_INSERT_TEACHER_RETURNING = SQL_INSERT_TEACHER + " RETURNING *"
+SQL_INSERT_OR_IGNORE_TEACHER = "INSERT OR IGNORE INTO teachers (username, salt, pw_hash, kdf, name, branch) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_FIND_TEACHER = "SELECT * FROM teachers WHERE username = ?"
+SQL_GET_NEXT_PRN = "SELECT value FROM meta WHERE key = 'next_prn'"
+SQL_SET_NEXT_PRN = "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_prn', ?)"
+SQL_BUMP_NEXT_PRN = "UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'next_prn' RETURNING value"
+# changes on a connection whenever a *different* connection commits to the file
+SQL_DATA_VERSION = "PRAGMA data_version"
+
+@functools.lru_cache(maxsize=32)
+def _sql_list_students_by_branch(columns: str) -> str:
+    return f"SELECT {columns} FROM students WHERE branch = ? ORDER BY division, class_roll"
 
 # Utilities
+def guarded_lru_cache(maxsize: int):
+    """LRU memoization of a one-argument function that is safe next to concurrent
+    writers: a result is only stored if cache_clear() didn't run while it was
+    being computed, so a read that overlapped a write can't re-cache the old row."""
+    def decorator(fn):
+        entries = OrderedDict()
+        lock = threading.Lock()
+        generation = 0
+
+        @functools.wraps(fn)
+        def wrapper(key):
+            with lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                    return entries[key]
+                started = generation
+            value = fn(key)
+            with lock:
+                if generation == started:
+                    entries[key] = value
+                    if len(entries) > maxsize:
+                        entries.popitem(last=False)
+            return value
+
+        def cache_clear():
+            nonlocal generation
+            with lock:
+                generation += 1
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+def ttl_cache(seconds: float):
+    """Memoize a one-argument function for `seconds`; the wrapper exposes
+    invalidate(key) and cache_clear() so writers can drop stale entries early.
+    Like guarded_lru_cache, a result computed while either of those ran is not
+    stored; expired entries are pruned whenever a new one is stored."""
+    def decorator(fn):
+        entries = {}
+        lock = threading.Lock()
+        generation = 0
+
+        @functools.wraps(fn)
+        def wrapper(key):
+            now = time.monotonic()
+            with lock:
+                hit = entries.get(key)
+                if hit is not None and now - hit[0] < seconds:
+                    return hit[1]
+                started = generation
+            value = fn(key)
+            with lock:
+                if generation == started:
+                    for k in [k for k, (at, _) in entries.items() if now - at >= seconds]:
+                        del entries[k]
+                    entries[key] = (now, value)
+            return value
+
+        def invalidate(key):
+            nonlocal generation
+            with lock:
+                generation += 1
+                entries.pop(key, None)
+
+        def cache_clear():
+            nonlocal generation
+            with lock:
+                generation += 1
+                entries.clear()
+
+        wrapper.invalidate = invalidate
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
 def ensure_data_dir():
     os.makedirs(DATA_DIR, exist_ok=True)
 
+# the KDF work is already a single C call; binding its parameters once keeps
+# the Python-side overhead per login to one call and two conversions
+_scrypt = functools.partial(hashlib.scrypt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=SCRYPT_DKLEN)
+_sha256 = hashlib.sha256
+
+def _scrypt_hex(password: str, salt: str) -> str:
+    return _scrypt(password.encode("utf-8"), salt=bytes.fromhex(salt)).hex()
+
 def hash_password(password: str, salt: Optional[str] = None) -> Dict[str,str]:
     if salt is None:
         salt = uuid.uuid4().hex
-    pw_hash = hashlib.sha256((salt + password).encode("utf-8")).hexdigest()
-    return {"salt": salt, "pw_hash": pw_hash}
+    pw_hash = _scrypt_hex(password, salt)
+    return {"salt": salt, "pw_hash": pw_hash, "kdf": KDF_SCRYPT}
+
+def verify_password(password: str, salt: str, pw_hash: str, kdf: Optional[str] = None) -> bool:
+    if kdf == KDF_SCRYPT:
+        candidate = _scrypt_hex(password, salt)
+    else:
+        # legacy single-round salted SHA-256
+        candidate = _sha256((salt + password).encode("utf-8")).hexdigest()
+    return hmac.compare_digest(candidate, pw_hash or "")
+
+_EMPTY_EXTRA = "{}"
+
+def dump_extra(extra) -> str:
+    # most students have no extras; skip the encoder for that case
+    if isinstance(extra, str):
+        return extra
+    return _dumps(extra) if extra else _EMPTY_EXTRA
 
-def verify_password(password: str, salt: str, pw_hash: str) -> bool:
-    return hashlib.sha256((salt + password).encode("utf-8")).hexdigest() == pw_hash
+def load_extra(raw) -> Dict:
+    if not isinstance(raw, str):
+        return raw or {}
+    return _loads(raw) if raw and raw != _EMPTY_EXTRA else {}
 
 def validate_nonempty(s: str, name: str):
     if not s or not s.strip():
@@ -58,281 +232,507 @@ def validate_nonempty(s: str, name: str):
     return s.strip()
 
 def branch_code(branch: str) -> str:
-    b = branch.strip().upper()
-    # take first two letters, pad if needed
-    code = (b[:2]).upper()
-    if len(code) < 2:
-        code = (code + "X")[:2]
-    return code
+    # first two letters, padded with X for one-letter branches
+    return (branch.strip().upper() + "XX")[:2]
+
+BRANCH_FULL_MESSAGE = "All divisions for this branch are full (3x70 = 210 students)."
+
+def format_class_roll(branch: str, division: str, current: int) -> str:
+    if current > MAX_PER_DIVISION:
+        raise ValueError(f"Division {division} in {branch} already full.")
+    return f"{branch_code(branch)}{division}{current:02d}"
+
+def student_email(first_name: str, last_name: str, prn: str, branch: str) -> str:
+    return f"{first_name.strip().lower()}.{last_name.strip().lower()}.{prn}@{branch.strip().lower()}.{COLLEGE_DOMAIN}"
 
 # -------------------------
 # SQLite persistence layer
 # -------------------------
 class Storage:
+    # fixed attribute layout: instance lookups on the hot query paths go
+    # through slot descriptors instead of a per-instance __dict__
+    __slots__ = ("conn", "fts_enabled", "_write_lock", "_readers", "_pool_size",
+                 "_fetch_student_by_username", "_fetch_teacher", "_cached_counts", "_data_version")
+
     def __init__(self, path=SQLITE_FILE):
         ensure_data_dir()
-        self.conn = sqlite3.connect(path)
-        self.conn.row_factory = sqlite3.Row
+        # `conn` is the single write connection; reads are served from a pool of
+        # reader connections, which WAL lets run alongside the writer
+        self.conn = self._connect(path)
+        self._write_lock = threading.RLock()
+        self._readers = queue.Queue()
+        self._pool_size = 0
+        # per-Storage LRU caches for login lookups; they hold immutable
+        # sqlite3.Row objects and are cleared after every student/teacher write
+        # commits (lookups overlapping that write are not re-cached), and when
+        # another connection or process has committed since the last lookup
+        self._fetch_student_by_username = guarded_lru_cache(1024)(self._query_student_by_username)
+        self._fetch_teacher = guarded_lru_cache(1024)(self._query_teacher)
+        # repeated stats views within COUNTS_TTL_SECONDS reuse the last counts
+        self._cached_counts = ttl_cache(COUNTS_TTL_SECONDS)(self._query_counts)
+        self._data_version = None
         self._init_schema()
         # migrate JSON if present and DB empty
         if self._is_empty() and (os.path.exists(JSON_STUDENTS) or os.path.exists(JSON_TEACHERS)):
             self._migrate_from_json()
+        # an in-memory database is private to its connection, so reads use the writer
+        self._pool_size = 0 if path == ":memory:" else READ_POOL_SIZE
+        for _ in range(self._pool_size):
+            self._readers.put(self._connect(path))
+
+    @staticmethod
+    def _connect(path) -> sqlite3.Connection:
+        # autocommit: transactions are only the explicit ones opened by transaction()
+        conn = sqlite3.connect(path, isolation_level=None, cached_statements=SQLITE_CACHED_STATEMENTS,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL + NORMAL sync: commits become sequential appends without an fsync each
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")  # ~64MB page cache
+        conn.execute("PRAGMA mmap_size=268435456")  # 256MB
+        return conn
+
+    @contextmanager
+    def read_conn(self):
+        if not self._pool_size:
+            with self.write_conn() as conn:
+                yield conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def write_conn(self):
+        with self._write_lock:
+            yield self.conn
+
+    @contextmanager
+    def transaction(self, mode: str = "IMMEDIATE"):
+        """Hold the writer and run the block in one explicit BEGIN .. COMMIT,
+        rolling back if it raises."""
+        with self.write_conn() as conn:
+            conn.execute(f"BEGIN {mode}")
+            try:
+                yield conn
+            except BaseException:
+                # SQLite may already have rolled back (e.g. SQLITE_FULL); a second
+                # ROLLBACK would raise and mask the original error
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        for _ in range(self._pool_size):
+            self._readers.get().close()
+        self._pool_size = 0
+        self.conn.close()
 
     def _init_schema(self):
-        cur = self.conn.cursor()
+        with self.transaction() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS students (
+                prn TEXT PRIMARY KEY,
+                class_roll TEXT UNIQUE,
+                username TEXT UNIQUE,
+                salt TEXT,
+                pw_hash TEXT,
+                kdf TEXT DEFAULT 'sha256',
+                first_name TEXT,
+                last_name TEXT,
+                branch TEXT,
+                division TEXT,
+                email TEXT,
+                extra TEXT
+            );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_students_branch_div ON students (branch, division)")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_students_names ON students (first_name, last_name)")
+            self._init_name_search(cur)
+            self._init_division_counts(cur)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS teachers (
+                username TEXT PRIMARY KEY,
+                salt TEXT,
+                pw_hash TEXT,
+                kdf TEXT DEFAULT 'sha256',
+                name TEXT,
+                branch TEXT
+            );
+            """)
+            # databases created before the kdf column existed
+            self._ensure_column(cur, "students", "kdf", "TEXT DEFAULT 'sha256'")
+            self._ensure_column(cur, "teachers", "kdf", "TEXT DEFAULT 'sha256'")
+            # ensure meta next_prn
+            cur.execute(SQL_GET_NEXT_PRN)
+            r = cur.fetchone()
+            if not r:
+                # default start
+                cur.execute(SQL_SET_NEXT_PRN, ("1001",))
+
+    def _ensure_column(self, cur, table: str, column: str, decl: str):
+        cur.execute(f"PRAGMA table_info({table})")
+        if column not in {r["name"] for r in cur.fetchall()}:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def _init_division_counts(self, cur):
+        # per branch/division head counts maintained by triggers, so seat
+        # allocation and stats read one small row set instead of a GROUP BY
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'branch_division_counts'")
+        exists = cur.fetchone() is not None
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS meta (
-            key TEXT PRIMARY KEY,
-            value TEXT
+        CREATE TABLE IF NOT EXISTS branch_division_counts (
+            branch TEXT NOT NULL,
+            division TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (branch, division)
         );
         """)
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            prn TEXT PRIMARY KEY,
-            class_roll TEXT UNIQUE,
-            username TEXT UNIQUE,
-            salt TEXT,
-            pw_hash TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            branch TEXT,
-            division TEXT,
-            email TEXT,
-            extra TEXT
-        );
+        CREATE TRIGGER IF NOT EXISTS students_counts_ai AFTER INSERT ON students
+        WHEN new.branch IS NOT NULL AND new.division IS NOT NULL BEGIN
+            INSERT INTO branch_division_counts (branch, division, count) VALUES (new.branch, new.division, 1)
+                ON CONFLICT (branch, division) DO UPDATE SET count = count + 1;
+        END;
         """)
         cur.execute("""
-        CREATE TABLE IF NOT EXISTS teachers (
-            username TEXT PRIMARY KEY,
-            salt TEXT,
-            pw_hash TEXT,
-            name TEXT,
-            branch TEXT
-        );
+        CREATE TRIGGER IF NOT EXISTS students_counts_ad AFTER DELETE ON students
+        WHEN old.branch IS NOT NULL AND old.division IS NOT NULL BEGIN
+            UPDATE branch_division_counts SET count = count - 1 WHERE branch = old.branch AND division = old.division;
+        END;
         """)
-        # ensure meta next_prn
-        cur.execute("SELECT value FROM meta WHERE key = 'next_prn'")
-        r = cur.fetchone()
-        if not r:
-            # default start
-            cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_prn', ?)", ("1001",))
-        self.conn.commit()
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS students_counts_au AFTER UPDATE OF branch, division ON students
+        WHEN old.branch IS NOT new.branch OR old.division IS NOT new.division BEGIN
+            UPDATE branch_division_counts SET count = count - 1 WHERE branch = old.branch AND division = old.division;
+            INSERT INTO branch_division_counts (branch, division, count)
+                SELECT new.branch, new.division, 1 WHERE new.branch IS NOT NULL AND new.division IS NOT NULL
+                ON CONFLICT (branch, division) DO UPDATE SET count = count + 1;
+        END;
+        """)
+        if not exists:
+            # seed from rows that predate the counters table
+            cur.execute("""
+            INSERT INTO branch_division_counts (branch, division, count)
+            SELECT branch, division, COUNT(*) FROM students
+            WHERE branch IS NOT NULL AND division IS NOT NULL
+            GROUP BY branch, division
+            """)
+
+    def _init_name_search(self, cur):
+        # LIKE '%frag%' can't use an index, so names are mirrored into an FTS5
+        # trigram table (substring matching) kept in sync by triggers.
+        # Falls back to LIKE scans when SQLite is built without FTS5.
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'students_fts'")
+        exists = cur.fetchone() is not None
+        try:
+            cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5 (
+                first_name, last_name,
+                content='students', content_rowid='rowid', tokenize='trigram'
+            );
+            """)
+        except sqlite3.OperationalError:
+            self.fts_enabled = False
+            return
+        self.fts_enabled = True
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS students_fts_ai AFTER INSERT ON students BEGIN
+            INSERT INTO students_fts (rowid, first_name, last_name) VALUES (new.rowid, new.first_name, new.last_name);
+        END;
+        """)
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS students_fts_ad AFTER DELETE ON students BEGIN
+            INSERT INTO students_fts (students_fts, rowid, first_name, last_name) VALUES ('delete', old.rowid, old.first_name, old.last_name);
+        END;
+        """)
+        # the fixed partial UPDATE always names both columns, so only reindex on a real change;
+        # recreated so databases holding the earlier unguarded trigger pick this up
+        cur.execute("DROP TRIGGER IF EXISTS students_fts_au")
+        cur.execute("""
+        CREATE TRIGGER students_fts_au AFTER UPDATE OF first_name, last_name ON students
+        WHEN old.first_name IS NOT new.first_name OR old.last_name IS NOT new.last_name BEGIN
+            INSERT INTO students_fts (students_fts, rowid, first_name, last_name) VALUES ('delete', old.rowid, old.first_name, old.last_name);
+            INSERT INTO students_fts (rowid, first_name, last_name) VALUES (new.rowid, new.first_name, new.last_name);
+        END;
+        """)
+        if not exists:
+            # index rows that were there before the FTS table
+            cur.execute("INSERT INTO students_fts (students_fts) VALUES ('rebuild')")
 
     def _is_empty(self) -> bool:
         cur = self.conn.cursor()
-        cur.execute("SELECT COUNT(*) as c FROM students")
+        cur.execute(SQL_COUNT_STUDENTS)
         return cur.fetchone()["c"] == 0
 
     def _migrate_from_json(self):
         print("Migrating JSON data into SQLite (if JSON files found)...")
-        cur = self.conn.cursor()
-        # students
-        try:
-            with open(JSON_STUDENTS, "r", encoding="utf-8") as f:
-                students = json.load(f)
-            for s in students:
-                cur.execute("""
-                    INSERT OR IGNORE INTO students (prn, class_roll, username, salt, pw_hash, first_name, last_name, branch, division, email, extra)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    s.get("prn"),
-                    s.get("class_roll"),
-                    s.get("username"),
-                    s.get("salt"),
-                    s.get("pw_hash"),
-                    s.get("first_name"),
-                    s.get("last_name"),
-                    s.get("branch"),
-                    s.get("division"),
-                    s.get("email"),
-                    json.dumps(s.get("extra", {}))
-                ))
-        except Exception:
-            pass
-        # teachers
-        try:
-            with open(JSON_TEACHERS, "r", encoding="utf-8") as f:
-                teachers = json.load(f)
-            for t in teachers:
-                cur.execute("""
-                    INSERT OR IGNORE INTO teachers (username, salt, pw_hash, name, branch)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
+        # one transaction for the whole migration; rows go in via executemany
+        with self.transaction() as conn:
+            cur = conn.cursor()
+            # students
+            try:
+                with open(JSON_STUDENTS, "r", encoding="utf-8") as f:
+                    students = json.load(f)
+                self._insert_students_many(cur, students, ignore_existing=True, default_kdf=KDF_SHA256)
+            except Exception:
+                pass
+            # teachers
+            try:
+                with open(JSON_TEACHERS, "r", encoding="utf-8") as f:
+                    teachers = json.load(f)
+                cur.executemany(SQL_INSERT_OR_IGNORE_TEACHER, ((
                     t.get("username"),
                     t.get("salt"),
                     t.get("pw_hash"),
+                    t.get("kdf", KDF_SHA256),
                     t.get("name"),
                     t.get("branch")
-                ))
-        except Exception:
-            pass
-        # meta
-        try:
-            with open(META_JSON, "r", encoding="utf-8") as f:
-                meta = json.load(f)
-            if meta.get("next_prn"):
-                cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_prn', ?)", (str(meta["next_prn"]),))
-        except Exception:
-            pass
-        self.conn.commit()
+                ) for t in teachers))
+            except Exception:
+                pass
+            # meta
+            try:
+                with open(META_JSON, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta.get("next_prn"):
+                    cur.execute(SQL_SET_NEXT_PRN, (str(meta["next_prn"]),))
+            except Exception:
+                pass
+        self._invalidate_student_cache()
+        self._fetch_teacher.cache_clear()
         print("Migration (attempt) complete. If you had JSON files, their data should be in the DB now.")
 
-    # meta
-    def get_next_prn(self) -> str:
-        cur = self.conn.cursor()
-        cur.execute("SELECT value FROM meta WHERE key='next_prn'")
-        v = int(cur.fetchone()["value"])
-        cur.execute("UPDATE meta SET value = ? WHERE key = 'next_prn'", (str(v + 1),))
-        self.conn.commit()
-        return str(v)
+    @staticmethod
+    def _open_seat(cur, branch: str) -> tuple:
+        """(division, class_roll) for the next student joining `branch`; the caller
+        owns the write transaction the seat is taken in."""
+        cur.execute(SQL_FIRST_OPEN_DIVISION, (branch, MAX_PER_DIVISION))
+        r = cur.fetchone()
+        if r is None:
+            raise ValueError(BRANCH_FULL_MESSAGE)
+        return r["division"], format_class_roll(branch, r["division"], r["c"] + 1)
+
+    def register_student_atomic(self, username: str, pw: Dict[str, str], first_name: str, last_name: str,
+                                branch: str, extra: Optional[Dict] = None) -> Dict:
+        """Allocate PRN, division and class roll and insert the student in one
+        write transaction, so concurrent registrations can't overfill a division."""
+        branch = branch.strip().upper()
+        with self.transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(SQL_STUDENT_USERNAME_EXISTS, (username,))
+            if cur.fetchone():
+                raise ValueError("Username already exists for a student.")
+            division, class_roll = self._open_seat(cur, branch)
+            cur.execute(SQL_BUMP_NEXT_PRN)
+            prn = str(int(cur.fetchone()["value"]) - 1)
+            student = {
+                "prn": prn,
+                "class_roll": class_roll,
+                "username": username,
+                "salt": pw["salt"],
+                "pw_hash": pw["pw_hash"],
+                "kdf": pw["kdf"],
+                "first_name": first_name.strip(),
+                "last_name": last_name.strip(),
+                "branch": branch,
+                "division": division,
+                "email": student_email(first_name, last_name, prn, branch),
+                "extra": extra or {}
+            }
+            self._insert_students_many(cur, [student])
+        self._invalidate_student_cache(branch)
+        return student
 
     # student CRUD
-    def insert_student(self, s: Dict):
-        cur = self.conn.cursor()
-        cur.execute("""
-            INSERT INTO students (prn, class_roll, username, salt, pw_hash, first_name, last_name, branch, division, email, extra)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            s["prn"], s.get("class_roll"), s["username"], s["salt"], s["pw_hash"],
-            s["first_name"], s["last_name"], s["branch"], s["division"], s["email"], json.dumps(s.get("extra", {}))
-        ))
-        self.conn.commit()
-
-    def update_student(self, prn: str, updates: Dict):
-        cur = self.conn.cursor()
-        columns = []
-        values = []
-        for k, v in updates.items():
-            if k == "extra":
-                v = json.dumps(v)
-            columns.append(f"{k} = ?")
-            values.append(v)
-        values.append(prn)
-        sql = f"UPDATE students SET {', '.join(columns)} WHERE prn = ?"
-        cur.execute(sql, tuple(values))
-        self.conn.commit()
+    @staticmethod
+    def _student_params(s: Dict, default_kdf: str = KDF_SCRYPT) -> tuple:
+        # required columns are indexed so a malformed dict fails with KeyError
+        return (
+            s["prn"], s.get("class_roll"), s["username"], s["salt"], s["pw_hash"], s.get("kdf", default_kdf),
+            s["first_name"], s["last_name"], s["branch"], s["division"], s["email"], dump_extra(s.get("extra"))
+        )
+
+    @staticmethod
+    def _migrated_student_params(s: Dict, default_kdf: str = KDF_SHA256) -> tuple:
+        # legacy JSON rows may be missing fields; import whatever is there
+        return (
+            s.get("prn"), s.get("class_roll"), s.get("username"), s.get("salt"), s.get("pw_hash"), s.get("kdf", default_kdf),
+            s.get("first_name"), s.get("last_name"), s.get("branch"), s.get("division"), s.get("email"), dump_extra(s.get("extra"))
+        )
+
+    def _insert_students_many(self, cur, students, ignore_existing=False, default_kdf=KDF_SCRYPT):
+        # caller owns the transaction; ignore_existing is the JSON migration path
+        if ignore_existing:
+            cur.executemany(SQL_INSERT_OR_IGNORE_STUDENT, (self._migrated_student_params(s, default_kdf) for s in students))
+        else:
+            cur.executemany(SQL_INSERT_STUDENT, (self._student_params(s, default_kdf) for s in students))
+
+    def bulk_insert_students(self, students):
+        """Insert many student dicts with one executemany in a single transaction."""
+        with self.transaction() as conn:
+            self._insert_students_many(conn.cursor(), students)
+        self._invalidate_student_cache()
+
+    def insert_student(self, s: Dict) -> Dict:
+        """Insert one student and return the stored row."""
+        with self.transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(SQL_INSERT_STUDENT_RETURNING, self._student_params(s))
+            row = dict(cur.fetchone())
+        self._invalidate_student_cache(row["branch"])
+        return row
+
+    def update_student(self, prn: str, updates: Dict, move_to_branch: Optional[str] = None) -> Optional[Dict]:
+        """Apply a partial update; returns the updated row, or None if `prn` doesn't exist.
+        With `move_to_branch`, the student also takes the first open seat there, picked
+        in the same write transaction as the update."""
+        unknown = set(updates) - set(STUDENT_UPDATE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot update student column(s): {', '.join(sorted(unknown))}")
+        if updates.get("extra") is not None:
+            updates = dict(updates, extra=dump_extra(updates["extra"]))
+        with self.transaction() as conn:
+            if move_to_branch is not None:
+                branch = move_to_branch.strip().upper()
+                division, class_roll = self._open_seat(conn.cursor(), branch)
+                updates = dict(updates, branch=branch, division=division, class_roll=class_roll)
+            r = conn.execute(SQL_UPDATE_STUDENT_RETURNING, tuple(updates.get(c) for c in STUDENT_UPDATE_COLUMNS) + (prn,)).fetchall()
+        r = r[0] if r else None
+        # the old branch isn't known here, so a move drops every cached count
+        self._invalidate_student_cache(counts="branch" in updates or "division" in updates)
+        return dict(r) if r else None
 
     def delete_student(self, prn: str):
-        cur = self.conn.cursor()
-        cur.execute("DELETE FROM students WHERE prn = ?", (prn,))
-        self.conn.commit()
+        with self.transaction() as conn:
+            conn.execute(SQL_DELETE_STUDENT, (prn,))
+        self._invalidate_student_cache()
 
     def find_student_by_prn(self, prn: str) -> Optional[Dict]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM students WHERE prn = ?", (prn,))
-        r = cur.fetchone()
+        with self.read_conn() as conn:
+            r = conn.execute(SQL_FIND_STUDENT_BY_PRN, (prn,)).fetchone()
         return dict(r) if r else None
 
+    def _invalidate_student_cache(self, branch: Optional[str] = None, counts: bool = True):
+        self._fetch_student_by_username.cache_clear()
+        if not counts:
+            return
+        if branch is None:
+            self._cached_counts.cache_clear()
+        else:
+            self._cached_counts.invalidate(branch.upper())
+
+    def _query_student_by_username(self, username: str) -> Optional[sqlite3.Row]:
+        with self.read_conn() as conn:
+            return conn.execute(SQL_FIND_STUDENT_BY_USERNAME, (username,)).fetchone()
+
+    def _sync_login_caches(self):
+        """Drop the login caches if another connection committed since the last
+        check; writes through this Storage clear them itself."""
+        with self.write_conn() as conn:
+            version = conn.execute(SQL_DATA_VERSION).fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+            self._fetch_student_by_username.cache_clear()
+            self._fetch_teacher.cache_clear()
+
     def find_student_by_username(self, username: str) -> Optional[Dict]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM students WHERE username = ?", (username,))
-        r = cur.fetchone()
+        self._sync_login_caches()
+        r = self._fetch_student_by_username(username)
         return dict(r) if r else None
 
     def find_student_by_class_roll(self, class_roll: str) -> Optional[Dict]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM students WHERE class_roll = ?", (class_roll,))
-        r = cur.fetchone()
+        with self.read_conn() as conn:
+            r = conn.execute(SQL_FIND_STUDENT_BY_CLASS_ROLL, (class_roll,)).fetchone()
         return dict(r) if r else None
 
-    def search_students_by_name(self, name_fragment: str) -> List[Dict]:
-        cur = self.conn.cursor()
-        like = f"%{name_fragment}%"
-        cur.execute("SELECT * FROM students WHERE first_name LIKE ? OR last_name LIKE ?", (like, like))
-        return [dict(r) for r in cur.fetchall()]
+    def search_students_by_name(self, name_fragment: str) -> List[sqlite3.Row]:
+        # trigram MATCH needs at least 3 characters; shorter fragments scan with LIKE
+        if self.fts_enabled and len(name_fragment) >= 3:
+            sql, params = SQL_SEARCH_STUDENTS_FTS, ('"' + name_fragment.replace('"', '""') + '"',)
+        else:
+            like = f"%{name_fragment}%"
+            sql, params = SQL_SEARCH_STUDENTS_LIKE, (like, like)
+        with self.read_conn() as conn:
+            return conn.execute(sql, params).fetchall()
 
-    def list_students_by_branch(self, branch: str) -> List[Dict]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM students WHERE branch = ? ORDER BY division, class_roll", (branch.upper(),))
-        return [dict(r) for r in cur.fetchall()]
+    def iter_students_by_branch(self, branch: str, columns: str = "*") -> Iterator[sqlite3.Row]:
+        # rows are returned as sqlite3.Row (index by column name); `columns` is
+        # a trusted, code-supplied projection so list views only read what they print
+        # the reader connection stays checked out until the rows are exhausted
+        with self.read_conn() as conn:
+            yield from conn.execute(_sql_list_students_by_branch(columns), (branch.upper(),))
+
+    def list_students_by_branch(self, branch: str, columns: str = "*") -> List[sqlite3.Row]:
+        return list(self.iter_students_by_branch(branch, columns))
 
     def count_by_branch_division(self, branch: str) -> Dict[str, int]:
-        cur = self.conn.cursor()
+        # copy so callers can't alter the cached entry
+        return dict(self._cached_counts(branch.upper()))
+
+    def _query_counts(self, branch: str) -> Dict[str, int]:
         res = {d:0 for d in DIVISIONS}
-        cur.execute("SELECT division, COUNT(*) as c FROM students WHERE branch = ? GROUP BY division", (branch.upper(),))
-        for r in cur.fetchall():
+        with self.read_conn() as conn:
+            rows = conn.execute(SQL_COUNT_BY_BRANCH_DIVISION, (branch,)).fetchall()
+        for r in rows:
             res[str(r["division"])] = int(r["c"])
         return res
 
     # teacher CRUD
-    def insert_teacher(self, t: Dict):
-        cur = self.conn.cursor()
-        cur.execute("""
-            INSERT INTO teachers (username, salt, pw_hash, name, branch)
-            VALUES (?, ?, ?, ?, ?)
-        """, (t["username"], t["salt"], t["pw_hash"], t["name"], t["branch"]))
-        self.conn.commit()
+    def insert_teacher(self, t: Dict) -> Dict:
+        with self.transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(SQL_INSERT_TEACHER_RETURNING, (t["username"], t["salt"], t["pw_hash"], t.get("kdf", KDF_SCRYPT), t["name"], t["branch"]))
+            r = dict(cur.fetchone())
+        self._fetch_teacher.cache_clear()
+        return r
+
+    def _query_teacher(self, username: str) -> Optional[sqlite3.Row]:
+        with self.read_conn() as conn:
+            return conn.execute(SQL_FIND_TEACHER, (username,)).fetchone()
 
     def find_teacher(self, username: str) -> Optional[Dict]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT * FROM teachers WHERE username = ?", (username,))
-        r = cur.fetchone()
+        self._sync_login_caches()
+        r = self._fetch_teacher(username)
         return dict(r) if r else None
 
 # -------------------------
 # Business logic wrappers
 # -------------------------
 class StudentDB:
+    __slots__ = ("storage",)
+
     def __init__(self, storage: Storage):
         self.storage = storage
 
-    def _generate_prn(self) -> str:
-        return self.storage.get_next_prn()
-
-    def _assign_division(self, branch: str) -> str:
-        counts = self.storage.count_by_branch_division(branch)
-        for d in DIVISIONS:
-            if counts.get(d, 0) < MAX_PER_DIVISION:
-                return d
-        raise ValueError("All divisions for this branch are full (3x70 = 210 students).")
-
-    def _generate_class_roll(self, branch: str, division: str) -> str:
-        # count existing in that branch+division, next roll is +1
-        counts = self.storage.count_by_branch_division(branch)
-        current = counts.get(division, 0) + 1
-        if current > MAX_PER_DIVISION:
-            raise ValueError(f"Division {division} in {branch} already full.")
-        return f"{branch_code(branch)}{division}{current:02d}"
-
-    def _generate_email(self, first_name, last_name, prn, branch):
-        uname = f"{first_name.lower()}.{last_name.lower()}.{prn}"
-        return f"{uname}@{branch.lower()}.{COLLEGE_DOMAIN}"
-
     def register_student(self, username, password, first_name, last_name, branch, extra=None):
         username = validate_nonempty(username, "username").lower()
-        # check uniqueness
-        if self.storage.find_student_by_username(username):
-            raise ValueError("Username already exists for a student.")
-        prn = self._generate_prn()
         pw = hash_password(password)
-        division = self._assign_division(branch)
-        class_roll = self._generate_class_roll(branch, division)
-        email = self._generate_email(first_name, last_name, prn, branch)
-        student = {
-            "prn": prn,
-            "class_roll": class_roll,
-            "username": username,
-            "salt": pw["salt"],
-            "pw_hash": pw["pw_hash"],
-            "first_name": first_name.strip(),
-            "last_name": last_name.strip(),
-            "branch": branch.strip().upper(),
-            "division": division,
-            "email": email,
-            "extra": extra or {}
-        }
-        self.storage.insert_student(student)
-        return student
+        return self.storage.register_student_atomic(username, pw, first_name, last_name, branch, extra)
 
     def student_login(self, username: str, password: str) -> Optional[Dict]:
         username = username.strip().lower()
         s = self.storage.find_student_by_username(username)
-        if s and verify_password(password, s["salt"], s["pw_hash"]):
+        if s and verify_password(password, s["salt"], s["pw_hash"], s.get("kdf")):
             # sanitize
             s.pop("pw_hash", None)
             s.pop("salt", None)
+            s.pop("kdf", None)
             # parse extra
-            s["extra"] = json.loads(s.get("extra") or "{}") if isinstance(s.get("extra"), str) else s.get("extra", {})
+            s["extra"] = load_extra(s.get("extra"))
             return s
         return None
 
@@ -341,16 +741,15 @@ class StudentDB:
         if self.storage.find_teacher(username):
             raise ValueError("Teacher username already exists.")
         pw = hash_password(password)
-        t = {"username": username, "salt": pw["salt"], "pw_hash": pw["pw_hash"], "name": name.strip(), "branch": branch.strip().upper()}
-        self.storage.insert_teacher(t)
-        t = self.storage.find_teacher(username)
-        t.pop("salt", None); t.pop("pw_hash", None)
+        t = {"username": username, "salt": pw["salt"], "pw_hash": pw["pw_hash"], "kdf": pw["kdf"], "name": name.strip(), "branch": branch.strip().upper()}
+        t = self.storage.insert_teacher(t)
+        t.pop("salt", None); t.pop("pw_hash", None); t.pop("kdf", None)
         return t
 
     def teacher_login(self, username, password):
         t = self.storage.find_teacher(username.strip().lower())
-        if t and verify_password(password, t["salt"], t["pw_hash"]):
-            t.pop("salt", None); t.pop("pw_hash", None)
+        if t and verify_password(password, t["salt"], t["pw_hash"], t.get("kdf")):
+            t.pop("salt", None); t.pop("pw_hash", None); t.pop("kdf", None)
             return t
         return None
 
@@ -369,19 +768,12 @@ class StudentDB:
             if k not in allowed:
                 continue
             applied[k] = v
-        if "branch" in applied:
-            new_branch = applied["branch"].upper()
-            # assign new division and class_roll for new branch
-            new_div = self._assign_division(new_branch)
-            new_roll = self._generate_class_roll(new_branch, new_div)
-            applied["branch"] = new_branch
-            applied["division"] = new_div
-            applied["class_roll"] = new_roll
+        # a branch move takes a new division and class_roll, assigned by storage
+        new_branch = applied.pop("branch", None)
         # convert extra to json if dict
-        if "extra" in applied and not isinstance(applied["extra"], str):
-            applied["extra"] = json.dumps(applied["extra"])
-        self.storage.update_student(prn, applied)
-        return self.storage.find_student_by_prn(prn)
+        if "extra" in applied:
+            applied["extra"] = dump_extra(applied["extra"])
+        return self.storage.update_student(prn, applied, move_to_branch=new_branch)
 
     def delete_student(self, prn: str, editor_branch: Optional[str] = None):
         s = self.storage.find_student_by_prn(prn)
@@ -399,38 +791,45 @@ class StudentDB:
         return {"total": total, "counts": counts, "remaining": remaining}
 
     def export_branch_csv(self, branch: str, path: str):
-        students = self.storage.list_students_by_branch(branch)
+        students = self.storage.list_students_by_branch(branch, EXPORT_COLUMNS)
         with open(path, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow(["PRN", "Class Roll", "First Name", "Last Name", "Branch", "Division", "Email"])
-            for s in students:
-                writer.writerow([s["prn"], s.get("class_roll"), s["first_name"], s["last_name"], s["branch"], s["division"], s["email"]])
+            writer.writerows([(s["prn"], s["class_roll"], s["first_name"], s["last_name"], s["branch"], s["division"], s["email"]) for s in students])
         return path
 
     def export_branch_pdf(self, branch: str, path: str):
         # requires reportlab; fallback to CSV raising an informative error
         if not REPORTLAB_AVAILABLE:
             raise RuntimeError("reportlab not installed. Install with `pip install reportlab` to enable PDF export.")
-        students = self.storage.list_students_by_branch(branch)
+        students = self.storage.list_students_by_branch(branch, EXPORT_COLUMNS)
         c = canvas.Canvas(path, pagesize=letter)
         width, height = letter
         title = f"Student List - {branch.upper()} - {datetime.now().strftime('%Y-%m-%d')}"
         c.setFont("Helvetica-Bold", 14)
         c.drawString(40, height - 50, title)
-        c.setFont("Helvetica", 10)
         y = height - 80
         line_height = 14
         headers = ["PRN", "ClassRoll", "Name", "Division", "Email"]
-        c.drawString(40, y, " | ".join(headers))
-        y -= line_height
+        lines = [" | ".join(headers)]
         for s in students:
             name = f"{s['first_name']} {s['last_name']}"
-            row = f"{s['prn']} | {s.get('class_roll','')} | {name} | {s['division']} | {s['email']}"
-            c.drawString(40, y, row[:200])  # trim long
-            y -= line_height
+            row = f"{s['prn']} | {s['class_roll']} | {name} | {s['division']} | {s['email']}"
+            lines.append(row[:200])  # trim long
+        # one text object per page instead of a drawString call per row
+        t = c.beginText(40, y)
+        t.setFont("Helvetica", 10, leading=line_height)
+        for line in lines:
+            # break before writing, so the last text object is never empty
             if y < 60:
+                c.drawText(t)
                 c.showPage()
                 y = height - 40
+                t = c.beginText(40, y)
+                t.setFont("Helvetica", 10, leading=line_height)
+            t.textLine(line)
+            y -= line_height
+        c.drawText(t)
         c.save()
         return path
 
@@ -445,18 +844,18 @@ class StudentDB:
         s = self.storage.find_student_by_prn(prn_or_class_roll) or self.storage.find_student_by_class_roll(prn_or_class_roll)
         if not s:
             return None
-        s.pop("pw_hash", None); s.pop("salt", None)
-        s["extra"] = json.loads(s.get("extra") or "{}") if isinstance(s.get("extra"), str) else s.get("extra", {})
+        s.pop("pw_hash", None); s.pop("salt", None); s.pop("kdf", None)
+        s["extra"] = load_extra(s.get("extra"))
         return s
 
     def change_student_password(self, username: str, old_password: str, new_password: str):
         s = self.storage.find_student_by_username(username.strip().lower())
         if not s:
             raise ValueError("Student not found.")
-        if not verify_password(old_password, s["salt"], s["pw_hash"]):
+        if not verify_password(old_password, s["salt"], s["pw_hash"], s.get("kdf")):
             raise ValueError("Old password incorrect.")
         pw = hash_password(new_password)
-        self.storage.update_student(s["prn"], {"salt": pw["salt"], "pw_hash": pw["pw_hash"]})
+        self.storage.update_student(s["prn"], {"salt": pw["salt"], "pw_hash": pw["pw_hash"], "kdf": pw["kdf"]})
         return True
 
 # -------------------------
@@ -584,12 +983,13 @@ def teacher_login_flow(db: StudentDB):
         c = input("Choose: ").strip()
         try:
             if c == "1":
-                students = db.storage.list_students_by_branch(t["branch"])
-                if not students:
+                students = db.storage.iter_students_by_branch(t["branch"], "prn, class_roll, first_name, last_name, division, email")
+                found = False
+                for s in students:
+                    found = True
+                    print(f"{s['prn']} | {s['class_roll']} | {s['first_name']} {s['last_name']} | Div {s['division']} | {s['email']}")
+                if not found:
                     print("No students.")
-                else:
-                    for s in students:
-                        print(f"{s['prn']} | {s.get('class_roll')} | {s['first_name']} {s['last_name']} | Div {s['division']} | {s['email']}")
             elif c == "2":
                 key = input("Enter PRN or Class Roll: ").strip()
                 prof = db.get_student_profile(key)
@@ -674,7 +1074,7 @@ def search_flow(db: StudentDB):
             print("No matches.")
         else:
             for s in res:
-                print(f"{s['prn']} | {s.get('class_roll')} | {s['first_name']} {s['last_name']} | {s['branch']}")
+                print(f"{s['prn']} | {s['class_roll']} | {s['first_name']} {s['last_name']} | {s['branch']}")
     elif ch == "2":
         q = input("PRN: ").strip()
         r = db.get_student_profile(q)
@@ -693,11 +1093,10 @@ def search_flow(db: StudentDB):
         print("Invalid choice.")
 
 def admin_list_all(db: StudentDB):
-    cur = db.storage.conn.cursor()
-    cur.execute("SELECT prn, class_roll, first_name, last_name, branch, division, email, username FROM students ORDER BY branch, division, class_roll")
-    rows = cur.fetchall()
-    for r in rows:
-        print(f"{r['prn']} | {r['class_roll']} | {r['first_name']} {r['last_name']} | {r['branch']} | Div {r['division']} | {r['email']} | {r['username']}")
+    with db.storage.read_conn() as conn:
+        # stream rows as SQLite produces them instead of materializing the table
+        for r in conn.execute(SQL_LIST_ALL_STUDENTS):
+            print(f"{r['prn']} | {r['class_roll']} | {r['first_name']} {r['last_name']} | {r['branch']} | Div {r['division']} | {r['email']} | {r['username']}")
 
 # Entry point
 def main():